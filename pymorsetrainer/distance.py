@@ -23,8 +23,8 @@ from enum import Enum
 Action = Enum("Action", ("NONE", "MATCH", "DELETION", "INSERTION"))
 
 
-def global_matching(a, b):
-    """Implementation of the Needle-Wunsch algorithm"""
+def global_matching(a, b, gap="-"):
+    """Implementation of the Needle-Wunsch algorithm, gaps are marked with gap"""
     len_a = len(a)
     len_b = len(b)
     distances = [[0 for j in range(len_b + 1)] for i in range(len_a + 1)]
@@ -48,10 +48,10 @@ def global_matching(a, b):
             minimum = cost[action]
             actions[i][j] = [a for a, c in cost.items() if c == minimum]
             distances[i][j] = cost[action]
-    return tuple([distances[len_a][len_b]] + __traceback(a, b, distances, actions))
+    return tuple([distances[len_a][len_b]] + __traceback(a, b, distances, actions, gap))
 
 
-def __traceback(a, b, distances, actions):
+def __traceback(a, b, distances, actions, gap):
     y = len(actions) - 1
     x = len(actions[0]) - 1
 
@@ -85,24 +85,25 @@ def __traceback(a, b, distances, actions):
             i += 1
             j += 1
         elif action == Action.INSERTION:
-            matching.append((a[i], "-"))
+            matching.append((a[i], gap))
             i += 1
         elif action == Action.DELETION:
-            matching.append(("-", b[j]))
+            matching.append((gap, b[j]))
             j += 1
 
     return ["".join(x) for x in zip(*matching)]
 
 
 def levenshtein(a, b):
-    return __do_levenshtein(a, b, len(a), len(b))
-
-
-def __do_levenshtein(a, b, i, j):
-    if 0 in (i, j):
-        return max(i, j)
-    return min(
-        __do_levenshtein(a, b, i - 1, j) + 1,
-        __do_levenshtein(a, b, i, j - 1) + 1,
-        __do_levenshtein(a, b, i - 1, j - 1) + (1 if a[i - 1] != b[j - 1] else 0),
-    )
+    """Edit distance between a and b, computed row by row"""
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (1 if a[i - 1] != b[j - 1] else 0),
+            )
+        previous = current
+    return previous[len(b)]
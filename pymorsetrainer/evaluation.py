@@ -0,0 +1,280 @@
+"""
+(C) 2017 David Kolossa
+
+This file is part of PyMorsetrainer.
+
+PyMorsetrainer is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyMorsetrainer is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyMorsetrainer.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import sys
+from multiprocessing import Pool
+
+import numpy
+
+from pymorsetrainer.distance import global_matching, levenshtein
+
+KOCH_LETTERS = "KMURESNAPTLWI.JZ=FOY,VG5/Q92H38B?47C1D60X"
+
+# Groups are split at whitespace, so a space never clashes with a letter
+GAP = " "
+
+
+def pair_groups(solutionText, inputText):
+    """
+    Split both texts into upper case groups and pad the received groups
+    with empty strings, so that every sent group has a counterpart.
+    """
+    solutionGroups = solutionText.upper().split()
+    inputGroups = inputText.upper().split()
+    if len(inputGroups) < len(solutionGroups):
+        inputGroups += [""] * (len(solutionGroups) - len(inputGroups))
+    return solutionGroups, inputGroups
+
+
+def align_groups(solutionGroups, inputGroups):
+    """Pairs of aligned (sent, received) strings, one per sent group"""
+    return [
+        global_matching(solutionGroup, inputGroups[idx], GAP)[1:]
+        for idx, solutionGroup in enumerate(solutionGroups)
+    ]
+
+
+def error_rate(solutionGroups, inputGroups):
+    """Levenshtein errors per sent letter, in percent"""
+    numLetters = 0.0
+    numErrors = 0.0
+    for idx, solutionGroup in enumerate(solutionGroups):
+        numLetters += len(solutionGroup)
+        numErrors += levenshtein(solutionGroup, inputGroups[idx])
+    if numLetters == 0:
+        return 0.0
+    return numErrors / numLetters * 100.0
+
+
+class ConfusionMatrix:
+    """
+    Counts how often each sent character was received as which character.
+
+    Rows are indexed by the sent, columns by the received character, both
+    in the order of KOCH_LETTERS. Two more rows and columns follow: "gap"
+    for alignment gaps (a missed letter in the column, an extra letter in
+    the row) and "other" for characters outside of KOCH_LETTERS. An
+    "other" character copied as a different "other" character is counted
+    in the "other (wrong)" column, so only exact copies are on the diagonal.
+    Alignments of a whole session can be added one after another.
+    """
+
+    labels = list(KOCH_LETTERS) + ["gap", "other", "other (wrong)"]
+    indices = {letter: idx for idx, letter in enumerate(KOCH_LETTERS)}
+    indices[GAP] = len(KOCH_LETTERS)
+    names = {"gap": "(missed)", "other": "(other)", "other (wrong)": "(different other)"}
+
+    def __init__(self):
+        size = len(self.labels)
+        self.counts = numpy.zeros((size, size), dtype=numpy.int64)
+
+    def add_alignment(self, solutionMatched, inputMatched):
+        """Add a pair of strings aligned by global_matching with GAP"""
+        other = len(self.labels) - 2
+        wrong = len(self.labels) - 1
+        sent = []
+        received = []
+        for s, r in zip(solutionMatched, inputMatched):
+            sentIdx = self.indices.get(s, other)
+            receivedIdx = self.indices.get(r, other)
+            if sentIdx == receivedIdx == other and s != r:
+                receivedIdx = wrong
+            sent.append(sentIdx)
+            received.append(receivedIdx)
+        numpy.add.at(self.counts, (sent, received), 1)
+
+    def add_alignments(self, alignments):
+        if not alignments:
+            return
+        solutionMatched, inputMatched = zip(*alignments)
+        self.add_alignment("".join(solutionMatched), "".join(inputMatched))
+
+    def sent(self):
+        return self.counts.sum(axis=1)
+
+    def correct(self):
+        return self.counts.diagonal()
+
+    def characters(self):
+        """Sent and correctly received count per sent character"""
+        sent = self.sent()
+        correct = self.correct()
+        gap = self.labels.index("gap")
+        return {
+            self.labels[row]: {"sent": int(sent[row]), "correct": int(correct[row])}
+            for row in numpy.flatnonzero(sent)
+            if row != gap
+        }
+
+    def to_dict(self):
+        """Non-zero counts as {sent: {received: count}}"""
+        result = {}
+        for row, col in zip(*numpy.nonzero(self.counts)):
+            result.setdefault(self.labels[row], {})[self.labels[col]] = int(
+                self.counts[row, col]
+            )
+        return result
+
+    def report(self, confusions=3):
+        """Rich text table of the accuracy and top confusions per character"""
+        sent = self.sent()
+        correct = self.correct()
+        gap = self.labels.index("gap")
+        rows = [
+            "<table align='center'><tr><td><pre>CHAR</pre></td>"
+            "<td align='right'><pre>SENT</pre></td>"
+            "<td align='right'><pre>ACCURACY</pre></td>"
+            "<td><pre>RECEIVED AS</pre></td></tr>"
+        ]
+        for row in numpy.flatnonzero(sent):
+            if row == gap:
+                continue
+            mistakes = self.counts[row].copy()
+            mistakes[row] = 0
+            common = [
+                "%s&nbsp;(%d)"
+                % (self.names.get(self.labels[col], self.labels[col]), mistakes[col])
+                for col in numpy.argsort(-mistakes, kind="stable")[:confusions]
+                if mistakes[col]
+            ]
+            rows.append(
+                "<tr><td><pre>%s</pre></td><td align='right'><pre>%d</pre></td>"
+                "<td align='right'><pre>%02.2f%%</pre></td><td><pre>%s</pre></td></tr>"
+                % (
+                    self.names.get(self.labels[row], self.labels[row]),
+                    sent[row],
+                    correct[row] / sent[row] * 100.0,
+                    " ".join(common),
+                )
+            )
+        rows.append("</table>")
+        if sent[gap]:
+            rows.append("Extra letters received: %d" % sent[gap])
+        return "".join(rows)
+
+
+def evaluate_transcript(solutionText, inputText):
+    """
+    Grade a single copy sheet against the sent text.
+
+    Returns a plain dictionary (so it can be pickled and dumped as JSON)
+    with the results per group and per sent character, and the confusion
+    matrix as {sent: {received: count}}. Gaps in the aligned groups are
+    marked with GAP.
+    """
+    solutionGroups, inputGroups = pair_groups(solutionText, inputText)
+
+    groups = []
+    confusion = ConfusionMatrix()
+    numLetters = 0
+    numErrors = 0
+    for idx, solutionGroup in enumerate(solutionGroups):
+        inputGroup = inputGroups[idx]
+        score, solutionMatched, inputMatched = global_matching(
+            solutionGroup, inputGroup, GAP
+        )
+        errors = levenshtein(solutionGroup, inputGroup)
+        numLetters += len(solutionGroup)
+        numErrors += errors
+        groups.append(
+            {
+                "sent": solutionGroup,
+                "received": inputGroup,
+                "sent_aligned": solutionMatched,
+                "received_aligned": inputMatched,
+                "score": score,
+                "errors": errors,
+            }
+        )
+        confusion.add_alignment(solutionMatched, inputMatched)
+
+    return {
+        "letters": numLetters,
+        "errors": numErrors,
+        "error_rate": numErrors / numLetters * 100.0 if numLetters else 0.0,
+        "groups": groups,
+        "characters": confusion.characters(),
+        "confusion": confusion.to_dict(),
+    }
+
+
+def _evaluate_pair(pair):
+    return evaluate_transcript(*pair)
+
+
+def evaluate_batch(pairs, processes=None, chunksize=1):
+    """
+    Grade many (sent, received) pairs.
+
+    The transcripts are independent, so they are spread over a process
+    pool. With processes=1 everything is graded in the calling process.
+    Results are returned in the order of the input pairs.
+    """
+    pairs = list(pairs)
+    if processes == 1 or len(pairs) < 2:
+        return [_evaluate_pair(pair) for pair in pairs]
+    with Pool(processes) as pool:
+        return pool.map(_evaluate_pair, pairs, chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Grade copy sheets against the sent exercise texts."
+    )
+    parser.add_argument(
+        "files",
+        nargs="+",
+        metavar="SENT RECEIVED",
+        help="pairs of text files: the sent exercise followed by the copy sheet",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("number of jobs must be at least 1")
+
+    if len(args.files) % 2 != 0:
+        parser.error("files must be given as SENT RECEIVED pairs")
+
+    pairs = []
+    for sentPath, receivedPath in zip(args.files[::2], args.files[1::2]):
+        with open(sentPath) as sentFile, open(receivedPath) as receivedFile:
+            pairs.append((sentFile.read(), receivedFile.read()))
+
+    results = evaluate_batch(pairs, processes=args.jobs)
+    for (sentPath, receivedPath), result in zip(
+        zip(args.files[::2], args.files[1::2]), results
+    ):
+        result["sent_file"] = sentPath
+        result["received_file"] = receivedPath
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,6 +25,7 @@ import sounddevice
 
 
 SAMPLE_RATE = 44100
+SAMPLE_RATES = (8000, 16000, 22050, 44100)
 
 
 class MorseCode:
@@ -57,10 +58,14 @@ class MorseCode:
 
     This so-called Farnsworth timing uses formulae defined as in
     http://www.arrl.org/files/file/Technology/x9004008.pdf
+
+    The tone is synthesized as float32 at the given sample rate. CW tones
+    rarely exceed 1 kHz, so rates as low as 8 kHz are sufficient.
     """
 
-    def __init__(self, morse_text):
+    def __init__(self, morse_text, rate=SAMPLE_RATE):
         self.morse_text = morse_text
+        self.rate = rate
 
     def set_morse_text(self, morse_text):
         self.morse_text = morse_text
@@ -94,20 +99,27 @@ class MorseCode:
         return morse_str
 
     def morse_tone(self, wpm, effective_wpm, frequency=800):
-        tones = []
-        for c in self.morse_code():
-            if c == ".":
-                tones.append(self.__dit(wpm, frequency))
-            if c == "-":
-                tones.append(self.__dah(wpm, frequency))
-            if c == " ":
-                tones.append(self.__dit_pause(wpm))
-            if c == "/":
-                tones.append(self.__dah_pause(wpm, effective_wpm))
-            if c == "#":
-                tones.append(self.__space(wpm, effective_wpm))
+        # Every tone is synthesized once, the pauses are only counted
+        tones = {
+            ".": self.__dit(wpm, frequency),
+            "-": self.__dah(wpm, frequency),
+        }
+        lengths = {
+            ".": len(tones["."]),
+            "-": len(tones["-"]),
+            " ": int(self.__dit_pause_length(wpm) * self.rate),
+            "/": int(self.__dah_pause_length(wpm, effective_wpm) * self.rate),
+            "#": int(self.__space_length(wpm, effective_wpm) * self.rate),
+        }
+        code = self.morse_code()
+        tone = numpy.zeros(sum(lengths[c] for c in code), dtype=numpy.float32)
+        position = 0
+        for c in code:
+            if c in tones:
+                tone[position:position + lengths[c]] = tones[c]
+            position += lengths[c]
         # As a rule of thumb, the bandwidth of a CW signal is 4 * WPM in Hertz
-        return numpy.concatenate(tones).astype(numpy.float32)
+        return tone
 
     def tally_length_in_seconds(self, wpm, effective_wpm):
         length = 0
@@ -153,64 +165,130 @@ class MorseCode:
 
     def __dit(self, wpm, frequency):
         return numpy.multiply(
-            self.__sine(self.__dit_length(wpm), frequency, SAMPLE_RATE),
-            self.__flank_mask(self.__dit_length(wpm)),
+            self.__sine(self.__dit_length(wpm), frequency, self.rate),
+            self.__flank_mask(self.__dit_length(wpm), self.rate),
         )
 
     def __dah(self, wpm, frequency):
         return numpy.multiply(
-            self.__sine(self.__dah_length(wpm), frequency, SAMPLE_RATE),
-            self.__flank_mask(self.__dah_length(wpm)),
+            self.__sine(self.__dah_length(wpm), frequency, self.rate),
+            self.__flank_mask(self.__dah_length(wpm), self.rate),
         )
 
-    def __dit_pause(self, wpm):
-        return self.__pause(self.__dit_pause_length(wpm), SAMPLE_RATE)
-
-    def __dah_pause(self, wpm, effective_wpm):
-        return self.__pause(self.__dah_pause_length(wpm, effective_wpm), SAMPLE_RATE)
-
-    def __space(self, wpm, effective_wpm):
-        return self.__pause(self.__space_length(wpm, effective_wpm), SAMPLE_RATE)
-
-    # Primitives to create sine waves of a certain length
-    # and pauses.
+    # Primitives to create sine waves of a certain length.
     #
     # Simple band-pass filtering is used to avoid clicks.
 
     @staticmethod
-    def __flank_mask(length):
+    def __flank_mask(length, rate=SAMPLE_RATE):
         # 5 milli seconds decay time
-        decaysamples = int(SAMPLE_RATE * 0.005)
-        decaystart = numpy.arange(decaysamples) / float(decaysamples)
-        decayend = decaystart[::-1]
-        return numpy.concatenate(
-            (
-                decaystart,
-                numpy.ones(int(length * SAMPLE_RATE - 2 * decaysamples)),
-                decayend,
-            )
-        )
+        decaysamples = int(rate * 0.005)
+        mask = numpy.ones(int(length * rate), dtype=numpy.float32)
+        decaystart = numpy.arange(decaysamples, dtype=numpy.float32) / decaysamples
+        mask[:decaysamples] = decaystart
+        mask[len(mask) - decaysamples:] = decaystart[::-1]
+        return mask
 
     @staticmethod
     def __sine(length, frequency, rate=SAMPLE_RATE):
         length = int(length * rate)
         factor = float(frequency) * (math.pi * 2) / rate
-        return numpy.sin(numpy.arange(length) * factor)
+        return numpy.sin(numpy.arange(length, dtype=numpy.float32) * factor)
 
-    @staticmethod
-    def __pause(length, rate=SAMPLE_RATE):
-        length = int(length * rate)
-        return numpy.arange(length) * 0
+
+class Spectrogram:
+    """
+    Short-time FFT of the audio passing through the sound callback.
+
+    The audio callback only copies its block into a preallocated ring
+    buffer (feed). The FFTs are computed later from another thread
+    (update), e.g. the GUI thread once per display refresh, so the
+    callback stays free of allocations and heavy work.
+
+    The result is kept as a waterfall image of 8 bit magnitudes, newest
+    row first, containing only the bins up to max_frequency.
+
+    All sizes are given in Hertz and seconds and converted to samples, so
+    the waterfall looks the same at every sample rate.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, bin_width=15.0, time_step=0.01,
+                 history=10.0, max_frequency=2000, dynamic_range=80.0):
+        self.rate = rate
+        self.fft_size = int(round(rate / bin_width))
+        self.hop_size = max(1, int(round(rate * time_step)))
+        self.dynamic_range = dynamic_range
+        self.bins = min(self.fft_size // 2 + 1,
+                        int(max_frequency * self.fft_size / rate) + 1)
+
+        # Keep about a second of audio, so a slow reader does not lose data
+        # while the callback keeps writing
+        self.capacity = max(self.fft_size, rate) + self.fft_size
+        self.buffer = numpy.zeros(self.capacity, dtype=numpy.float32)
+        self.written = 0
+        self.read = 0
+
+        self.window = numpy.hanning(self.fft_size).astype(numpy.float32)
+        # Magnitude of a full scale sine after windowing
+        self.reference = self.window.sum() / 2
+        self.offsets = numpy.arange(self.fft_size)
+        self.image = numpy.zeros(
+            (int(history / time_step), self.bins), dtype=numpy.uint8
+        )
+
+    def feed(self, block):
+        """Append a block of samples. Safe to call from the audio callback."""
+        length = len(block)
+        start = self.written % self.capacity
+        first = min(length, self.capacity - start)
+        self.buffer[start:start + first] = block[:first]
+        self.buffer[:length - first] = block[first:]
+        self.written += length
+
+    def update(self):
+        """Transform all complete frames fed since the last call.
+
+        Returns the number of new waterfall rows."""
+        written = self.written
+        # Skip frames which have already been overwritten in the ring buffer
+        oldest = written - self.capacity // 2
+        if self.read < oldest:
+            self.read = oldest + (self.read - oldest) % self.hop_size
+        count = (written - self.fft_size - self.read) // self.hop_size + 1
+        if count <= 0:
+            return 0
+        if count > len(self.image):
+            # Only the newest frames fit into the waterfall anyway
+            self.read += (count - len(self.image)) * self.hop_size
+            count = len(self.image)
+
+        starts = self.read + self.hop_size * numpy.arange(count)
+        indices = (starts[:, numpy.newaxis] + self.offsets) % self.capacity
+        frames = self.buffer[indices]
+        frames *= self.window
+        magnitudes = numpy.abs(numpy.fft.rfft(frames)[:, :self.bins])
+        self.read += count * self.hop_size
+
+        decibels = 20 * numpy.log10(magnitudes / self.reference + 1e-12)
+        levels = numpy.clip(
+            (decibels + self.dynamic_range) * (255 / self.dynamic_range), 0, 255
+        )
+        self.image[count:] = self.image[:-count]
+        self.image[:count] = levels[::-1]
+        return count
 
 
 class MorsePlayer(Thread):
-    def __init__(self, morse_text, wpm, effective_wpm, frequency):
-        self.morse = MorseCode(morse_text)
+    def __init__(self, morse_text, wpm, effective_wpm, frequency,
+                 spectrogram=None, rate=SAMPLE_RATE):
+        self.morse = MorseCode(morse_text, rate)
+        self.rate = rate
         self.wpm = wpm
         self.effective_wpm = effective_wpm
         self.frequency = frequency
         self.samples = numpy.reshape(self.morse.morse_tone(self.wpm, self.effective_wpm, self.frequency), (-1, 1))
         self.current_frame = 0
+        self.spectrogram = spectrogram
         self.playback_finished = Event()
         super(MorsePlayer, self).__init__()
 
@@ -221,11 +299,14 @@ class MorsePlayer(Thread):
         outdata[:chunksize] = self.samples[self.current_frame:self.current_frame + chunksize]
         if chunksize < frames:
             outdata[chunksize:] = 0
+        if self.spectrogram is not None:
+            self.spectrogram.feed(outdata[:, 0])
+        if chunksize < frames:
             raise sounddevice.CallbackStop()
         self.current_frame += chunksize
 
     def run(self):
-        with sounddevice.Stream(channels=1, callback=self.sound_data_callback, finished_callback=self.playback_finished.set, dtype='float32'):
+        with sounddevice.Stream(samplerate=self.rate, channels=1, callback=self.sound_data_callback, finished_callback=self.playback_finished.set, dtype='float32'):
             self.playback_finished.wait()
 
     def shutdown(self):
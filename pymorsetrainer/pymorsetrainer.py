@@ -21,8 +21,8 @@ import sys
 import functools
 from threading import Thread
 import random
-from PyQt5.Qt import Qt, QSettings
-from PyQt5.QtGui import QFont
+from PyQt5.Qt import Qt, QSettings, QTimer
+from PyQt5.QtGui import QFont, QImage, QPainter
 from PyQt5.QtWidgets import (
     QWidget,
     QApplication,
@@ -42,10 +42,21 @@ from PyQt5.QtWidgets import (
     QToolButton,
 )
 
-from pymorsetrainer.morselib import MorsePlayer, MorseCode
-from pymorsetrainer.distance import global_matching, levenshtein
-
-KOCH_LETTERS = "KMURESNAPTLWI.JZ=FOY,VG5/Q92H38B?47C1D60X"
+from pymorsetrainer.morselib import (
+    MorsePlayer,
+    MorseCode,
+    Spectrogram,
+    SAMPLE_RATE,
+    SAMPLE_RATES,
+)
+from pymorsetrainer.evaluation import (
+    KOCH_LETTERS,
+    ConfusionMatrix,
+    GAP,
+    align_groups,
+    error_rate,
+    pair_groups,
+)
 
 
 class MainWindow(QMainWindow):
@@ -58,11 +69,14 @@ class MainWindow(QMainWindow):
             self.settings.setValue("effectiveWpm", "15")
             self.settings.setValue("frequency", "800")
             self.settings.setValue("duration", "60")
+            self.settings.setValue("sampleRate", str(SAMPLE_RATE))
 
         self.requireNewExercise = False
         self.mp = None
         self.lessonButtons = []
         self.debug = False
+        self.sessionConfusion = ConfusionMatrix()
+        self.talliedSolution = None
 
         super().__init__()
         self.initUI()
@@ -111,6 +125,15 @@ class MainWindow(QMainWindow):
         )
         durationLabel = QLabel("Duration (seconds)")
 
+        self.rateCombo = QComboBox()
+        for rate in SAMPLE_RATES:
+            self.rateCombo.addItem(str(rate))
+        self.rateCombo.setCurrentIndex(SAMPLE_RATES.index(self.sampleRate()))
+        self.rateCombo.currentTextChanged.connect(
+            functools.partial(self.settings.setValue, "sampleRate")
+        )
+        rateLabel = QLabel("Sample rate (Hz)")
+
         self.lessonGrid = QGridLayout()
 
         lessonCombo = QComboBox()
@@ -130,6 +153,8 @@ class MainWindow(QMainWindow):
 
         self.createLessonLetterButtons(self.lessonGrid)
 
+        self.waterfall = WaterfallWidget()
+
         mainLayout = QVBoxLayout()
 
         inputAndParameters = QHBoxLayout()
@@ -153,12 +178,15 @@ class MainWindow(QMainWindow):
         parameterGrid.addWidget(freqLabel, 2, 1)
         parameterGrid.addWidget(self.durationLineEdit, 3, 0)
         parameterGrid.addWidget(durationLabel, 3, 1)
+        parameterGrid.addWidget(self.rateCombo, 4, 0)
+        parameterGrid.addWidget(rateLabel, 4, 1)
         parameterField.addLayout(parameterGrid)
         parameterField.insertSpacing(-1, 15)
         parameterField.addLayout(lessonBox)
         parameterField.insertStretch(-1)
 
         mainLayout.addLayout(inputAndParameters)
+        mainLayout.addWidget(self.waterfall)
         mainLayout.addLayout(self.lessonGrid)
 
         self.centralWidget.setLayout(mainLayout)
@@ -199,7 +227,17 @@ class MainWindow(QMainWindow):
         wpm = int(self.settings.value("wpm"))
         effectiveWpm = int(self.settings.value("effectiveWpm"))
         frequency = int(self.settings.value("frequency"))
-        self.mp = MorsePlayer(text, wpm, effectiveWpm, frequency)
+        rate = self.sampleRate()
+        # Stay clear of the Nyquist frequency, the tone would alias otherwise
+        if rate < 2.5 * frequency:
+            rate = next(
+                (r for r in SAMPLE_RATES if r >= 2.5 * frequency), SAMPLE_RATES[-1]
+            )
+        self.waterfall.setRate(rate)
+        self.mp = MorsePlayer(
+            text, wpm, effectiveWpm, frequency, self.waterfall.spectrogram, rate
+        )
+        self.waterfall.start(self.mp)
         self.mp.start()
 
     def playExercise(self):
@@ -210,6 +248,7 @@ class MainWindow(QMainWindow):
     def stopPlaying(self):
         if self.mp is not None:
             self.mp.shutdown()
+        self.waterfall.stop()
 
     def newLessonSelected(self, comboId):
         newLesson = comboId + 1
@@ -238,14 +277,28 @@ class MainWindow(QMainWindow):
             print(self.morse_solution)
 
     def checkInput(self):
+        solutionGroups, inputGroups = pair_groups(
+            self.morse_solution, self.receivedTextEdit.toPlainText()
+        )
+        alignments = align_groups(solutionGroups, inputGroups)
+        # Checking the same exercise again must not count it twice
+        if self.talliedSolution != self.morse_solution:
+            self.sessionConfusion.add_alignments(alignments)
+            self.talliedSolution = self.morse_solution
         self.evalWindow = EvaluationWindow(
-            self.receivedTextEdit.toPlainText().upper(), self.morse_solution
+            solutionGroups, inputGroups, alignments, self.sessionConfusion
         )
         self.evalWindow.setModal(True)
         self.evalWindow.show()
         self.requireNewExercise = True
         self.receivedTextEdit.clear()
 
+    def sampleRate(self):
+        rate = str(self.settings.value("sampleRate", SAMPLE_RATE))
+        if rate not in [str(r) for r in SAMPLE_RATES]:
+            return SAMPLE_RATE
+        return int(rate)
+
     def saveChangedText(self, inputField, settingName):
         self.settings.setValue(settingName, inputField.text())
 
@@ -253,30 +306,67 @@ class MainWindow(QMainWindow):
         self.debug = True
 
 
+class WaterfallWidget(QWidget):
+    def __init__(self):
+        super(WaterfallWidget, self).__init__()
+        self.spectrogram = Spectrogram()
+        self.setMinimumHeight(100)
+        self.setSizePolicy(QSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed))
+
+        # The FFTs are computed here, not in the audio callback, and only
+        # as often as the screen can show them.
+        refreshRate = QApplication.primaryScreen().refreshRate() or 60
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(int(1000 / refreshRate))
+        self.refreshTimer.timeout.connect(self.refresh)
+        self.player = None
+
+    def setRate(self, rate):
+        if rate != self.spectrogram.rate:
+            self.spectrogram = Spectrogram(rate)
+
+    def start(self, player):
+        self.player = player
+        self.refreshTimer.start()
+
+    def stop(self):
+        self.refreshTimer.stop()
+        self.player = None
+
+    def refresh(self):
+        if self.spectrogram.update():
+            self.update()
+        if self.player is not None and self.player.playback_finished.is_set():
+            self.stop()
+
+    def paintEvent(self, event):
+        image = self.spectrogram.image
+        height, width = image.shape
+        waterfallImage = QImage(
+            image.data, width, height, width, QImage.Format_Grayscale8
+        )
+        painter = QPainter(self)
+        painter.drawImage(self.rect(), waterfallImage)
+        painter.end()
+
+
 class EvaluationWindow(QDialog):
-    def __init__(self, inputText, solutionText):
-        self.inputText = inputText
-        self.solutionText = solutionText
+    def __init__(self, solutionGroups, inputGroups, alignments, sessionConfusion):
+        self.solutionGroups = solutionGroups
+        self.inputGroups = inputGroups
+        self.alignments = alignments
+        self.sessionConfusion = sessionConfusion
         super(EvaluationWindow, self).__init__()
         self.initUI()
 
     def initUI(self):
-        inputGroups = self.inputText.split()
-        solutionGroups = self.solutionText.split()
-
-        numLetters = 0.0
-        numErrors = 0.0
-        for idx, _ in enumerate(solutionGroups):
-            if idx >= len(inputGroups):
-                inputGroups.append("")
-            numLetters += len(solutionGroups[idx])
-            numErrors += levenshtein(solutionGroups[idx], inputGroups[idx])
-        percentage = numErrors / numLetters * 100.0
-
-        solutionLabel = QLabel(
-            self.createEvaluationRichText(solutionGroups, inputGroups)
-        )
+        percentage = error_rate(self.solutionGroups, self.inputGroups)
+
+        solutionLabel = QLabel(self.createEvaluationRichText(self.alignments))
         errorLabel = QLabel("Error count (Levenshtein): %02.2f%%" % percentage)
+        confusionLabel = QLabel(
+            "Session results per character:" + self.sessionConfusion.report()
+        )
 
         layout = QVBoxLayout()
         layout.addWidget(solutionLabel)
@@ -288,41 +378,31 @@ class EvaluationWindow(QDialog):
             )
             layout.addWidget(successLabel)
 
+        layout.addWidget(confusionLabel)
+
         self.setLayout(layout)
         self.setWindowTitle("Evaluation")
 
-    def createEvaluationRichText(self, solutionGroups, inputGroups):
-        richText = "<table align='center'><tr><td align='center'><pre>SENT</pre></td><td align='center'><pre>RECEIVED</pre></t></tr>"
-        for idx, solutionGroup in enumerate(solutionGroups):
-            richText += "<tr>"
-            if idx >= len(inputGroups):
-                inputGroups.append("")
-            _, solutionMatched, inputMatched = global_matching(
-                solutionGroups[idx], inputGroups[idx]
-            )
-            colorSolution, colorInput = "", ""
-            for idx, _ in enumerate(solutionMatched):
-                if solutionMatched[idx] == inputMatched[idx]:
-                    colorSolution += (
-                        "<span style='color: green'>" + solutionMatched[idx] + "</span>"
-                    )
-                    colorInput += (
-                        "<span style='color: green'>" + inputMatched[idx] + "</span>"
-                    )
-                else:
-                    colorSolution += (
-                        "<span style='color: red'>" + solutionMatched[idx] + "</span>"
-                    )
-                    colorInput += (
-                        "<span style='color: red'>" + inputMatched[idx] + "</span>"
-                    )
-            richText += (
-                "<td align='center'><pre>"
-                + colorSolution
-                + "</pre></td><td align='center'><pre>"
-                + colorInput
-                + "</pre></td>"
-            )
-            richText += "</tr>"
-        richText += "</table>"
-        return richText
+    def createEvaluationRichText(self, alignments):
+        richText = [
+            "<table align='center'><tr><td align='center'><pre>SENT</pre></td><td align='center'><pre>RECEIVED</pre></t></tr>"
+        ]
+        for solutionMatched, inputMatched in alignments:
+            colorSolution, colorInput = [], []
+            for solutionLetter, inputLetter in zip(solutionMatched, inputMatched):
+                color = "green" if solutionLetter == inputLetter else "red"
+                solutionLetter = "-" if solutionLetter == GAP else solutionLetter
+                inputLetter = "-" if inputLetter == GAP else inputLetter
+                colorSolution.append(
+                    "<span style='color: %s'>%s</span>" % (color, solutionLetter)
+                )
+                colorInput.append(
+                    "<span style='color: %s'>%s</span>" % (color, inputLetter)
+                )
+            richText.append("<tr><td align='center'><pre>")
+            richText.extend(colorSolution)
+            richText.append("</pre></td><td align='center'><pre>")
+            richText.extend(colorInput)
+            richText.append("</pre></td></tr>")
+        richText.append("</table>")
+        return "".join(richText)
@@ -4,10 +4,13 @@ setup(
     version="0.0.1.dev1",
     packages=find_packages(),
     entry_points={
-        'gui_scripts': ['pymorsetrainer = pymorsetrainer.__main__:main']
+        'gui_scripts': ['pymorsetrainer = pymorsetrainer.__main__:main'],
+        'console_scripts': [
+            'pymorsetrainer-grade = pymorsetrainer.evaluation:main'
+        ],
     },
 
-    install_requires=['PyQt5>=5.0', 'numpy>=1.10', 'pyaudio>=0.2.0'],
+    install_requires=['PyQt5>=5.5', 'numpy>=1.10', 'pyaudio>=0.2.0'],
 
     package_data={
     },